@@ -9,7 +9,12 @@ import pygame
 import math
 import random
 import os
+import sys
 import json
+import struct
+import zlib
+import asyncio
+import argparse
 from collections import deque
 
 # --- محاولة استدعاء مكتبات اللغة العربية بأمان تام ---
@@ -25,6 +30,11 @@ except ImportError:
 # ==========================================
 # 1. الإعدادات والثوابت (Game Configurations)
 # ==========================================
+# كلاينت الـ Versus بيشتغل من غير شاشة ولا صوت (Headless)
+if "--versus" in sys.argv:
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
 pygame.init()
 pygame.mixer.init()
 
@@ -54,6 +64,21 @@ COLS = 11
 RADIUS = 22
 DIAMETER = RADIUS * 2
 ROW_HEIGHT = int(DIAMETER * math.sin(math.radians(60)))
+UNDO_DEPTH = 30 # عدد الخطوات اللي ممكن نرجعها (كل لقطة أقل من 200 بايت)
+UNDO_INVENTORY = ("coins", "bombs", "fireballs", "rainbows") # بترجع مع التراجع
+AIM_STATES = ("PLAYING", "VERSUS") # الحالات اللي فيها تصويب بالماوس أو الصباع
+
+# إعدادات وضع الـ Versus
+VERSUS_LEVEL = 3
+VERSUS_HOST = "127.0.0.1"
+# الـ Versus جوه اللعبة للكمبيوتر بس: على الأندرويد مفيش إذن INTERNET ولا طريقة لإدخال عنوان الخصم
+IS_ANDROID = "ANDROID_ARGUMENT" in os.environ # python-for-android بيحدده
+VERSUS_IN_MENU = not IS_ANDROID
+VERSUS_PORT = 50555
+VERSUS_MAX_TICKS = FPS * 60 * 5 # المباراة 5 دقايق بالكتير
+GARBAGE_GROUP = 5      # كل 5 فقاعات في مجموعة واحدة = صف عقاب للخصم
+GARBAGE_DROP = 3       # كل 3 فقاعات واقعة = صف عقاب للخصم
+CHECKSUM_INTERVAL = 15 # كل كام tick نقارن الـ checksum بين اللاعبين
 
 # تهيئة الشاشة والخطوط
 screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
@@ -86,6 +111,29 @@ class SaveSystem:
         with open(SaveSystem.FILE_NAME, 'w') as f:
             json.dump(data, f)
 
+    # --- حفظ اللوحة في نص المستوى (لو الأندرويد قفل اللعبة) ---
+    BOARD_FILE = "board.sav"
+
+    @staticmethod
+    def load_board():
+        if os.path.exists(SaveSystem.BOARD_FILE):
+            with open(SaveSystem.BOARD_FILE, 'rb') as f:
+                return f.read()
+        return None
+
+    @staticmethod
+    def save_board(data):
+        # نكتب في ملف مؤقت وبعدين نستبدل، عشان لو اللعبة اتقفلت وسط الكتابة الحفظ القديم يفضل سليم
+        tmp = SaveSystem.BOARD_FILE + ".tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, SaveSystem.BOARD_FILE)
+
+    @staticmethod
+    def clear_board():
+        if os.path.exists(SaveSystem.BOARD_FILE):
+            os.remove(SaveSystem.BOARD_FILE)
+
 # تحميل البيانات
 game_data = SaveSystem.load()
 
@@ -98,6 +146,15 @@ def render_text(text_ar, text_en, font, color):
     else:
         return font.render(text_en, True, color)
 
+_TEXT_CACHE = {}
+
+def render_text_cached(text_ar, text_en, font, color):
+    """نفس render_text بس للنصوص الثابتة (العناوين) عشان مانعيدش رسمها كل فريم"""
+    key = (text_ar, text_en, id(font), color)
+    if key not in _TEXT_CACHE:
+        _TEXT_CACHE[key] = render_text(text_ar, text_en, font, color)
+    return _TEXT_CACHE[key]
+
 class SoundManager:
     """نظام إدارة الأصوات بدون أخطاء إذا كانت الملفات غير موجودة"""
     def __init__(self):
@@ -169,11 +226,35 @@ class Button:
         self.text_en = text_en
         self.hovered = False
         self.scale = 1.0
+        self._label = None # كاش لسطح النص عشان مانرسمهوش كل فريم
+
+    def set_text(self, text_ar, text_en):
+        """تغيير النص وإلغاء الكاش فقط لو النص اتغير فعلاً"""
+        if text_ar != self.text_ar or text_en != self.text_en:
+            self.text_ar = text_ar
+            self.text_en = text_en
+            self._label = None
+
+    def get_label(self):
+        if self._label is None:
+            self._label = render_text(self.text_ar, self.text_en, font_med, TEXT_COLOR)
+        return self._label
+
+    @property
+    def animating(self):
+        target_scale = 1.1 if self.hovered else 1.0
+        return self.scale != target_scale
 
-    def draw(self, surface):
-        # تأثير التكبير عند الوقوف بالماوس
+    def update(self):
+        # تأثير التكبير عند الوقوف بالماوس (بيشتغل بس أثناء الانتقال)
+        if not self.animating: return
         target_scale = 1.1 if self.hovered else 1.0
         self.scale += (target_scale - self.scale) * 0.2
+        if abs(target_scale - self.scale) < 0.005:
+            self.scale = target_scale
+
+    def draw(self, surface):
+        self.update()
         
         w = int(self.rect.width * self.scale)
         h = int(self.rect.height * self.scale)
@@ -184,12 +265,52 @@ class Button:
         pygame.draw.rect(surface, self.color, r, border_radius=15)
         pygame.draw.rect(surface, (255, 255, 255), r, width=2, border_radius=15) # إطار
         
-        txt_surf = render_text(self.text_ar, self.text_en, font_med, TEXT_COLOR)
+        txt_surf = self.get_label()
         surface.blit(txt_surf, (r.centerx - txt_surf.get_width()//2, r.centery - txt_surf.get_height()//2))
 
-    def check_hover(self, mouse_pos):
-        self.hovered = self.rect.collidepoint(mouse_pos)
-        return self.hovered
+class UIScreen:
+    """فهرس اللمس لكل شاشة (Hit-Test Index): أزرار ومناطق مع الأكشن بتاعها"""
+    def __init__(self):
+        self.targets = [] # (rect, button أو None, action) بالترتيب = الأولوية
+        self.buttons = []
+        self.hovered = None
+
+    def add_button(self, button, action):
+        self.targets.append((button.rect, button, action))
+        self.buttons.append(button)
+        return button
+
+    def add_zone(self, rect, action):
+        """منطقة ضغط بدون زرار مرسوم (مثال: منطقة التبديل عند المدفع)"""
+        self.targets.append((pygame.Rect(rect), None, action))
+
+    def hit_test(self, pos):
+        for rect, button, action in self.targets:
+            if rect.collidepoint(pos):
+                return button, action
+        return None, None
+
+    def dispatch(self, pos):
+        """تنفيذ أكشن أول هدف تحت النقطة، وترجع True لو الضغطة اتاكلت"""
+        button, action = self.hit_test(pos)
+        if action is None: return False
+        action()
+        return True
+
+    def update_hover(self, pos):
+        button, _ = self.hit_test(pos)
+        if button is self.hovered: return
+        if self.hovered: self.hovered.hovered = False
+        if button: button.hovered = True
+        self.hovered = button
+
+    def clear_hover(self):
+        if self.hovered: self.hovered.hovered = False
+        self.hovered = None
+
+    def draw(self, surface):
+        for button in self.buttons:
+            button.draw(surface)
 
 # ==========================================
 # 3. كائنات اللعبة الأساسية (Game Entities)
@@ -237,11 +358,15 @@ class Bubble:
                 sound_mgr.play("bounce")
 
 class GridManager:
-    def __init__(self, level):
+    def __init__(self, level, cells=None, rng=random, top_margin=80):
         self.grid = [[None for _ in range(COLS)] for _ in range(ROWS)]
-        self.top_margin = 80
+        self.top_margin = top_margin # لازم يتحدد قبل load_cells عشان get_xy
         self.level = level
-        self.populate_initial_grid()
+        self.rng = rng # مولد عشوائي خاص عشان وضع الـ Versus يبقى متطابق عند اللاعبين
+        if cells is None:
+            self.populate_initial_grid()
+        else:
+            self.load_cells(cells)
 
     def populate_initial_grid(self):
         # كل مستوى بيزود الألوان والصفوف
@@ -252,10 +377,27 @@ class GridManager:
         for row in range(num_rows):
             for col in range(COLS):
                 if row % 2 != 0 and col == COLS - 1: continue
-                color = random.choice(available_colors)
+                color = self.rng.choice(available_colors)
                 x, y = self.get_xy(row, col)
                 self.grid[row][col] = Bubble(x, y, color)
 
+    def load_cells(self, cells):
+        """إعادة بناء الشبكة من قائمة (color_name, powerup) أو None لكل خلية"""
+        self.grid = [[None for _ in range(COLS)] for _ in range(ROWS)]
+        for i, cell in enumerate(cells):
+            if cell is None: continue
+            row, col = divmod(i, COLS)
+            x, y = self.get_xy(row, col)
+            self.grid[row][col] = Bubble(x, y, cell[0], cell[1])
+
+    def lower_ceiling(self):
+        """نزول السقف صف واحد، وكل الفقاعات بتنزل معاه"""
+        self.top_margin += ROW_HEIGHT
+        for row in range(ROWS):
+            for col in range(COLS):
+                if self.grid[row][col]:
+                    self.grid[row][col].x, self.grid[row][col].y = self.get_xy(row, col)
+
     def get_xy(self, row, col):
         x = col * DIAMETER + RADIUS
         if row % 2 != 0: x += RADIUS
@@ -277,7 +419,27 @@ class GridManager:
             for col in range(COLS):
                 if self.grid[row][col]:
                     active.add(self.grid[row][col].color_name)
-        return list(active) if active else ["red"]
+        # بترتيب COLORS مش ترتيب الـ set عشان النتيجة تبقى ثابتة بين أي جهازين
+        return [name for name in COLORS if name in active] or ["red"]
+
+    def push_rows(self, count):
+        """إضافة صفوف عقاب (Garbage) من فوق ودفع الشبكة لتحت، ترجع True لو فقاعات وقعت برة الشبكة
+
+        العدد لازم يكون زوجي عشان إزاحة الصفوف الفردية تفضل صح، ولو أكبر من الشبكة بيتقص.
+        """
+        count = min(count, ROWS - ROWS % 2)
+        active = self.get_active_colors()
+        overflow = any(self.grid[r][c] for r in range(ROWS - count, ROWS) for c in range(COLS))
+        self.grid = [[None for _ in range(COLS)] for _ in range(count)] + self.grid[:ROWS - count]
+        for row in range(ROWS):
+            for col in range(COLS):
+                if row < count:
+                    if row % 2 != 0 and col == COLS - 1: continue
+                    x, y = self.get_xy(row, col)
+                    self.grid[row][col] = Bubble(x, y, self.rng.choice(active))
+                elif self.grid[row][col]:
+                    self.grid[row][col].x, self.grid[row][col].y = self.get_xy(row, col)
+        return overflow
 
     def draw(self, surface):
         for row in range(ROWS):
@@ -303,16 +465,23 @@ class Shooter:
     def reload(self, powerup=None):
         active = self.gm.get_active_colors()
         if not self.current:
-            self.current = Bubble(self.x, self.y, random.choice(active))
-            self.next = Bubble(self.x - 100, self.y + 20, random.choice(active))
+            self.current = Bubble(self.x, self.y, self.gm.rng.choice(active))
+            self.next = Bubble(self.x - 100, self.y + 20, self.gm.rng.choice(active))
         else:
             self.current = self.next
             self.current.x, self.current.y = self.x, self.y
-            self.next = Bubble(self.x - 100, self.y + 20, random.choice(active))
+            self.next = Bubble(self.x - 100, self.y + 20, self.gm.rng.choice(active))
 
         if powerup:
             self.current.is_powerup = powerup
 
+    def restore(self, current, next_bubble, shots_fired):
+        """استرجاع الفقاعة الحالية واللي بعدها من Snapshot"""
+        self.flying = None
+        self.shots_fired = shots_fired
+        self.current = Bubble(self.x, self.y, current[0], current[1])
+        self.next = Bubble(self.x - 100, self.y + 20, next_bubble[0], next_bubble[1])
+
     def swap(self):
         # ميزة التبديل (Swap UX Feature)
         if not self.current.is_powerup and not self.next.is_powerup:
@@ -335,7 +504,7 @@ class Shooter:
         self.reload()
         sound_mgr.play("shoot")
 
-    def draw(self, surface, mouse_pos):
+    def draw(self, surface, aim_pos):
         # قاعدة المدفع
         pygame.draw.circle(surface, (80, 80, 100), (self.x, self.y), 45)
         pygame.draw.circle(surface, (40, 40, 60), (self.x, self.y), 35)
@@ -343,9 +512,9 @@ class Shooter:
         # مكان الفقاعة القادمة
         pygame.draw.circle(surface, (50, 50, 70), (self.x - 100, self.y + 20), RADIUS + 5)
         
-        if self.flying is None and mouse_pos[1] < self.y:
-            dx = mouse_pos[0] - self.x
-            dy = mouse_pos[1] - self.y
+        if self.flying is None and aim_pos[1] < self.y:
+            dx = aim_pos[0] - self.x
+            dy = aim_pos[1] - self.y
             angle = math.atan2(dy, dx)
             # خط تصويب طويل ومريح
             for i in range(1, 15):
@@ -362,54 +531,80 @@ class Shooter:
         if self.next: self.next.draw(surface)
         if self.flying: self.flying.draw(surface)
 
-# ==========================================
-# 4. محرك اللعبة وإدارة الحالات (Game Engine & States)
-# ==========================================
+class BoardCodec:
+    """ترميز ثنائي مضغوط لحالة اللوحة (Snapshot) للتراجع والاستكمال والـ Replays
 
-class Engine:
-    def __init__(self):
-        self.state = "MENU"
-        self.running = True
-        self.particles = []
-        self.texts = []
-        self.screen_shake = 0
-        
-        # UI القائمة الرئيسية
-        self.btn_play = Button(SCREEN_WIDTH//2, 400, 250, 60, "العب الآن", "PLAY NOW", COLORS["green"])
-        self.btn_store = Button(SCREEN_WIDTH//2, 500, 250, 60, "المتجر", "STORE", COLORS["blue"])
-        self.btn_settings = Button(SCREEN_WIDTH//2, 600, 250, 60, "الإعدادات", "SETTINGS", COLORS["purple"])
-        self.btn_quit = Button(SCREEN_WIDTH//2, 700, 250, 60, "خروج", "QUIT", COLORS["red"])
-        
-        # UI المتجر
-        self.btn_buy_bomb = Button(SCREEN_WIDTH//2, 300, 300, 60, "قنبلة (100 عملة)", "BOMB (100)", (100, 100, 100))
-        self.btn_buy_fire = Button(SCREEN_WIDTH//2, 400, 300, 60, "كرة نار (150 عملة)", "FIRE (150)", COLORS["orange"])
-        self.btn_buy_rain = Button(SCREEN_WIDTH//2, 500, 300, 60, "ألوان (200 عملة)", "RAINBOW (200)", COLORS["cyan"])
-        self.btn_back = Button(SCREEN_WIDTH//2, 700, 200, 60, "رجوع", "BACK", COLORS["red"])
+    كل فقاعة = بايت واحد: النص الأدنى رقم اللون (0 = فاضية) والنص الأعلى رقم القوة الخارقة.
+    الهيدر: النسخة، المستوى، top_margin، shots_fired، السكور، الكومبو.
+    """
+    VERSION = 1
+    HEADER = struct.Struct("<BHHIIH")
+    COLOR_IDS = list(COLORS.keys())
+    POWERUPS = [None, "bomb", "fireball", "rainbow"]
+    SIZE = HEADER.size + ROWS * COLS + 2
 
-        # UI الإعدادات
-        self.btn_sound = Button(SCREEN_WIDTH//2, 400, 300, 60, "الصوت: تشغيل/إيقاف", "SOUND: ON/OFF", COLORS["blue"])
+    @staticmethod
+    def encode_bubble(b):
+        if b is None: return 0
+        return (BoardCodec.COLOR_IDS.index(b.color_name) + 1) | (BoardCodec.POWERUPS.index(b.is_powerup) << 4)
 
-        # UI اللعب (Powerups)
-        self.btn_use_bomb = Button(100, SCREEN_HEIGHT - 30, 80, 40, "قنبلة", "BOMB", (100, 100, 100))
-        self.btn_use_fire = Button(SCREEN_WIDTH//2, SCREEN_HEIGHT - 30, 80, 40, "نار", "FIRE", COLORS["orange"])
-        self.btn_use_rain = Button(SCREEN_WIDTH - 100, SCREEN_HEIGHT - 30, 80, 40, "قوس", "RAIN", COLORS["cyan"])
+    @staticmethod
+    def decode_bubble(byte):
+        """ValueError لو رقم اللون أو القوة الخارقة برة المدى"""
+        if byte == 0: return None
+        color_id, powerup_id = (byte & 0x0F) - 1, byte >> 4
+        if not (0 <= color_id < len(BoardCodec.COLOR_IDS) and powerup_id < len(BoardCodec.POWERUPS)):
+            raise ValueError(f"invalid bubble byte {byte:#04x}")
+        return BoardCodec.COLOR_IDS[color_id], BoardCodec.POWERUPS[powerup_id]
 
-        self.reset_game()
+    @staticmethod
+    def encode(gm, shooter, score, combo):
+        header = BoardCodec.HEADER.pack(BoardCodec.VERSION, gm.level, gm.top_margin,
+                                        shooter.shots_fired, score, combo)
+        enc = BoardCodec.encode_bubble
+        cells = bytes([enc(b) for row in gm.grid for b in row])
+        return header + cells + bytes([enc(shooter.current), enc(shooter.next)])
 
-    def reset_game(self):
-        self.gm = GridManager(game_data["level"])
-        self.shooter = Shooter(self.gm)
-        self.score = 0
-        self.combo = 1
-        self.particles.clear()
-        self.texts.clear()
+    @staticmethod
+    def decode(data):
+        """يرجع dict فيه كل الحقول، أو None لو البيانات تالفة أو من نسخة قديمة"""
+        if len(data) != BoardCodec.SIZE: return None
+        version, level, top_margin, shots_fired, score, combo = BoardCodec.HEADER.unpack_from(data)
+        if version != BoardCodec.VERSION: return None
+        dec = BoardCodec.decode_bubble
+        body = data[BoardCodec.HEADER.size:]
+        try:
+            cells = [dec(byte) for byte in body[:ROWS * COLS]]
+            current, next_bubble = dec(body[-2]), dec(body[-1])
+        except ValueError:
+            return None
+        return {
+            "level": level, "top_margin": top_margin, "shots_fired": shots_fired,
+            "score": score, "combo": combo,
+            "cells": cells, "current": current, "next": next_bubble,
+        }
 
+# ==========================================
+# 4. محرك اللعبة وإدارة الحالات (Game Engine & States)
+# ==========================================
+
+class BoardRules:
+    """قواعد اللوحة المشتركة بين اللعب الفردي والـ Versus (التطابق، التساقط، التثبيت)
+
+    الكلاس اللي بيستخدمها لازم يكون فيه gm و shooter و score و combo و screen_shake.
+    """
     def spawn_particles(self, x, y, color, count=10):
-        for _ in range(count):
-            self.particles.append(Particle(x, y, color))
+        pass
 
     def add_floating_text(self, x, y, text_ar, text_en, color):
-        self.texts.append(FloatingText(x, y, text_ar, text_en, color))
+        pass
+
+    def award_coins(self, amount):
+        pass
+
+    def on_cleared(self, popped, dropped):
+        """بتتنده بعد كل تثبيت بعدد الفقاعات اللي اتفرقعت واللي وقعت"""
+        pass
 
     def get_neighbors(self, r, c):
         directions = [(-1, -1), (-1, 0), (0, -1), (0, 1), (1, -1), (1, 0)] if r % 2 == 0 else [(-1, 0), (-1, 1), (0, -1), (0, 1), (1, 0), (1, 1)]
@@ -417,28 +612,32 @@ class Engine:
 
     def process_match(self, r, c):
         b = self.gm.grid[r][c]
-        if not b: return
+        if not b: return 0
         
         # معالجة القوى الخارقة (Powerups Logic)
         if b.is_powerup == "bomb":
             self.screen_shake = 20
             self.add_floating_text(b.x, b.y, "انفجار!", "BOOM!", COLORS["red"])
+            popped = 0
             for nr, nc in self.get_neighbors(r, c) + [(r,c)]:
                 if self.gm.grid[nr][nc]:
                     self.spawn_particles(self.gm.grid[nr][nc].x, self.gm.grid[nr][nc].y, self.gm.grid[nr][nc].color)
                     self.gm.grid[nr][nc] = None
+                    popped += 1
             sound_mgr.play("pop")
-            return True
+            return popped
 
         if b.is_powerup == "fireball":
             self.screen_shake = 15
             self.add_floating_text(b.x, b.y, "حريق!", "FIRE!", COLORS["orange"])
+            popped = 0
             for col in range(COLS):
                 if self.gm.grid[r][col]:
                     self.spawn_particles(self.gm.grid[r][col].x, self.gm.grid[r][col].y, self.gm.grid[r][col].color)
                     self.gm.grid[r][col] = None
+                    popped += 1
             sound_mgr.play("pop")
-            return True
+            return popped
 
         # الخوارزمية العادية (Flood Fill) للبحث عن الألوان المتطابقة أو الـ Rainbow
         target_color = b.color_name
@@ -460,7 +659,7 @@ class Engine:
         if len(group) >= 3:
             pts = len(group) * 10 * self.combo
             self.score += pts
-            game_data["coins"] += len(group) # كل فقاعة بعملة
+            self.award_coins(len(group)) # كل فقاعة بعملة
             self.add_floating_text(b.x, b.y, f"+{pts}", f"+{pts}", GOLD)
             
             if self.combo > 1:
@@ -472,10 +671,10 @@ class Engine:
             
             self.combo += 1
             sound_mgr.play("pop")
-            return True
+            return len(group)
             
         self.combo = 1 # فقدان الكومبو لو مفيش تطابق
-        return False
+        return 0
 
     def remove_floating(self):
         """إسقاط الفقاعات غير المتصلة بالسقف (BFS Algorithm)"""
@@ -504,13 +703,361 @@ class Engine:
         if dropped > 0:
             pts = dropped * 20
             self.score += pts
-            game_data["coins"] += dropped * 2
+            self.award_coins(dropped * 2)
             self.add_floating_text(SCREEN_WIDTH//2, 300, "تساقط رائع!", "GREAT DROP!", COLORS["cyan"])
+        return dropped
+
+    def step_flying(self):
+        """تحريك الفقاعة الطايرة خطوة واحدة، وترجع True لو اتثبتت في الشبكة"""
+        f = self.shooter.flying
+        if not f: return False
+        f.move()
+        collided = False
+        if f.y - f.radius <= self.gm.top_margin: collided = True
+        else:
+            for r in range(ROWS):
+                for c in range(COLS):
+                    t = self.gm.grid[r][c]
+                    if t and math.hypot(f.x - t.x, f.y - t.y) <= RADIUS * 2 - 4:
+                        collided = True; break
+                if collided: break
+        
+        if not collided: return False
+
+        # التثبيت (Snapping)
+        r, c = self.gm.get_row_col(f.x, f.y)
+        if self.gm.grid[r][c]: # لو المكان مليان
+            for nr, nc in self.get_neighbors(r, c):
+                if not self.gm.grid[nr][nc]:
+                    r, c = nr, nc; break
+        
+        if r < ROWS:
+            f.x, f.y = self.gm.get_xy(r, c)
+            f.is_moving = False
+            self.gm.grid[r][c] = f
+            
+            popped = self.process_match(r, c)
+            dropped = self.remove_floating() if popped else 0
+            self.on_cleared(popped, dropped)
+
+            # آلية سقوط السقف لزيادة الصعوبة
+            if self.shooter.shots_fired % 10 == 0:
+                self.gm.lower_ceiling()
+                self.screen_shake = 5
+                self.add_floating_text(SCREEN_WIDTH//2, 150, "السقف يقترب!", "CEILING DROP!", COLORS["red"])
+
+        self.shooter.flying = None
+        return True
+
+class Engine(BoardRules):
+    def __init__(self):
+        self.state = "MENU"
+        self.running = True
+        self.particles = []
+        self.texts = []
+        self.screen_shake = 0
+        
+        # نقطة التصويب (بتتحدث من الماوس أو سحب الصباع)
+        self.aim_pos = (SCREEN_WIDTH//2, SCREEN_HEIGHT//2)
+        self.aim_finger = None # finger_id للصباع اللي بيصوب (الصوابع التانية متتحسبش)
+        
+        # UI القائمة الرئيسية
+        self.btn_play = Button(SCREEN_WIDTH//2, 400, 250, 60, "العب الآن", "PLAY NOW", COLORS["green"])
+        self.btn_versus = Button(SCREEN_WIDTH//2, 500, 250, 60, "تحدي صاحبك", "VERSUS", COLORS["orange"])
+        self.btn_store = Button(SCREEN_WIDTH//2, 600, 250, 60, "المتجر", "STORE", COLORS["blue"])
+        self.btn_settings = Button(SCREEN_WIDTH//2, 700, 250, 60, "الإعدادات", "SETTINGS", COLORS["purple"])
+        self.btn_quit = Button(SCREEN_WIDTH//2, 800, 250, 60, "خروج", "QUIT", COLORS["red"])
+        
+        # UI المتجر
+        self.btn_buy_bomb = Button(SCREEN_WIDTH//2, 300, 300, 60, "قنبلة (100 عملة)", "BOMB (100)", (100, 100, 100))
+        self.btn_buy_fire = Button(SCREEN_WIDTH//2, 400, 300, 60, "كرة نار (150 عملة)", "FIRE (150)", COLORS["orange"])
+        self.btn_buy_rain = Button(SCREEN_WIDTH//2, 500, 300, 60, "ألوان (200 عملة)", "RAINBOW (200)", COLORS["cyan"])
+        self.btn_back = Button(SCREEN_WIDTH//2, 700, 200, 60, "رجوع", "BACK", COLORS["red"])
+
+        # UI الإعدادات
+        self.btn_sound = Button(SCREEN_WIDTH//2, 400, 300, 60, "الصوت: تشغيل/إيقاف", "SOUND: ON/OFF", COLORS["blue"])
+
+        # UI اللعب (Powerups)
+        self.btn_use_bomb = Button(100, SCREEN_HEIGHT - 30, 80, 40, "قنبلة", "BOMB", (100, 100, 100))
+        self.btn_use_fire = Button(SCREEN_WIDTH//2, SCREEN_HEIGHT - 30, 80, 40, "نار", "FIRE", COLORS["orange"])
+        self.btn_use_rain = Button(SCREEN_WIDTH - 100, SCREEN_HEIGHT - 30, 80, 40, "قوس", "RAIN", COLORS["cyan"])
+        self.btn_undo = Button(SCREEN_WIDTH - 100, SCREEN_HEIGHT - 85, 80, 40, "تراجع", "UNDO", PANEL_COLOR)
+
+        # UI الـ Versus
+        self.btn_host = Button(SCREEN_WIDTH//2, 400, 300, 60, "افتح مباراة", "HOST", COLORS["green"])
+        self.btn_join = Button(SCREEN_WIDTH//2, 500, 300, 60, "ادخل مباراة", "JOIN", COLORS["blue"])
+        self.btn_leave = Button(SCREEN_WIDTH - 60, 30, 90, 40, "خروج", "EXIT", COLORS["red"])
+        self.versus = None # VersusSession الحالية
+
+        # سجل اللقطات للتراجع (Ring Buffer): (بيانات اللوحة، العملات والأدوات وقتها)
+        self.history = deque(maxlen=UNDO_DEPTH)
+
+        self.build_ui()
+        self.reset_game()
+
+    def build_ui(self):
+        """بناء فهرس اللمس لكل شاشة (بدل ما نلف على كل الزراير مع كل ضغطة)"""
+        menu = UIScreen()
+        items = [(self.btn_play, self.start_game),
+                 (self.btn_versus, lambda: self.set_state("VERSUS_LOBBY")),
+                 (self.btn_store, lambda: self.set_state("STORE")),
+                 (self.btn_settings, lambda: self.set_state("SETTINGS")),
+                 (self.btn_quit, self.quit)]
+        if not VERSUS_IN_MENU:
+            items.pop(1)
+        # ترتيب الأزرار من فوق لتحت من غير فراغ مكان زرار الـ Versus لو مخفي
+        for i, (button, action) in enumerate(items):
+            button.rect.centery = 400 + i * 100
+            menu.add_button(button, action)
+
+        store = UIScreen()
+        store.add_button(self.btn_buy_bomb, lambda: self.buy("bombs", 100))
+        store.add_button(self.btn_buy_fire, lambda: self.buy("fireballs", 150))
+        store.add_button(self.btn_buy_rain, lambda: self.buy("rainbows", 200))
+        store.add_button(self.btn_back, self.close_store)
+
+        settings = UIScreen()
+        settings.add_button(self.btn_sound, sound_mgr.toggle)
+        settings.add_button(self.btn_back, lambda: self.set_state("MENU"))
+
+        # شريط الأدوات في اللعب + منطقة التبديل عند المدفع
+        playing = UIScreen()
+        playing.add_button(self.btn_use_bomb, lambda: self.use_powerup("bombs", "bomb"))
+        playing.add_button(self.btn_use_fire, lambda: self.use_powerup("fireballs", "fireball"))
+        playing.add_button(self.btn_use_rain, lambda: self.use_powerup("rainbows", "rainbow"))
+        playing.add_button(self.btn_undo, self.undo)
+        sx, sy = SCREEN_WIDTH // 2, SCREEN_HEIGHT - 80
+        playing.add_zone((sx - 120, sy - 40, 160, 80), lambda: self.shooter.swap())
+
+        lobby = UIScreen()
+        lobby.add_button(self.btn_host, lambda: self.start_versus("host"))
+        lobby.add_button(self.btn_join, lambda: self.start_versus("join"))
+        lobby.add_button(self.btn_back, lambda: self.set_state("MENU"))
+
+        versus = UIScreen()
+        versus.add_button(self.btn_leave, lambda: self.set_state("MENU"))
+        versus.add_zone((sx - 120, sy - 40, 160, 80), lambda: self.versus.queue_input(SWAP_INPUT))
+
+        self.ui = {"MENU": menu, "STORE": store, "SETTINGS": settings, "PLAYING": playing,
+                   "VERSUS_LOBBY": lobby, "VERSUS": versus}
+
+    def set_state(self, state):
+        if self.state in self.ui: self.ui[self.state].clear_hover()
+        if self.state == "VERSUS" and state != "VERSUS": self.end_versus()
+        self.state = state
+        self.aim_finger = None
+
+    def start_versus(self, role):
+        self.versus = VersusSession(role)
+        self.set_state("VERSUS")
+
+    def end_versus(self):
+        if self.versus:
+            self.versus.close()
+            self.versus = None
+
+    def start_game(self):
+        self.set_state("PLAYING")
+        # استكمال المستوى من مكان ما اللاعب وقف لو فيه حفظ
+        data = SaveSystem.load_board()
+        if data and self.restore_snapshot(data):
+            self.history.clear()
+            self.particles.clear()
+            self.texts.clear()
+        else:
+            self.reset_game()
+
+    def close_store(self):
+        self.set_state("MENU")
+        SaveSystem.save(game_data)
+
+    def quit(self):
+        self.save_board()
+        self.end_versus()
+        self.running = False
+
+    def snapshot(self):
+        return BoardCodec.encode(self.gm, self.shooter, self.score, self.combo)
+
+    def restore_snapshot(self, data):
+        """ترجع False لو اللقطة مش صالحة أو من مستوى تاني"""
+        snap = BoardCodec.decode(data)
+        if snap is None or snap["level"] != game_data["level"]: return False
+        if snap["current"] is None or snap["next"] is None: return False
+        self.gm = GridManager(snap["level"], snap["cells"], top_margin=snap["top_margin"])
+        self.shooter.gm = self.gm
+        self.shooter.restore(snap["current"], snap["next"], snap["shots_fired"])
+        self.score = snap["score"]
+        self.combo = snap["combo"]
+        return True
+
+    def save_board(self):
+        """العملات والأدوات بتتحفظ مع اللوحة دايماً عشان الاستكمال يبقى متطابق
+
+        game_data الأول: لو اللعبة اتقفلت بين الكتابتين، أقصى حاجة أداة تضيع مش تيجي ببلاش.
+        """
+        SaveSystem.save(game_data)
+        if self.state == "PLAYING" and self.shooter.flying is None:
+            SaveSystem.save_board(self.snapshot())
+
+    def fire(self, pos):
+        """ضرب الفقاعة مع حفظ لقطة قبلها عشان التراجع"""
+        snap = self.snapshot()
+        self.shooter.shoot(pos[0], pos[1])
+        if self.shooter.flying is not None:
+            self.history.append((snap, {key: game_data[key] for key in UNDO_INVENTORY}))
+
+    def undo(self):
+        if self.shooter.flying is not None or not self.history: return
+        snap, inventory = self.history.pop()
+        if self.restore_snapshot(snap):
+            # منع تجميع العملات بالتراجع، ورجوع الأدوات اللي اتصرفت بعد اللقطة
+            game_data.update(inventory)
+            self.save_board()
+            self.particles.clear()
+            self.texts.clear()
+
+    def buy(self, item, price):
+        if game_data["coins"] >= price:
+            game_data["coins"] -= price
+            game_data[item] += 1
+
+    def shoot_at(self, pos):
+        """الضربة في اللعب الفردي بتتنفذ على طول، وفي الـ Versus بتتبعت كإدخال الـ tick الجاي"""
+        if self.state == "PLAYING":
+            self.fire(pos)
+        elif self.state == "VERSUS" and self.versus.player:
+            dx = pos[0] - self.versus.player.shooter.x
+            dy = pos[1] - self.versus.player.shooter.y
+            if dy < -10: # نفس شرط Shooter.shoot
+                self.versus.queue_input(encode_shot(math.degrees(math.atan2(-dy, dx))))
+
+    def use_powerup(self, item, powerup):
+        if game_data[item] > 0:
+            game_data[item] -= 1
+            self.shooter.reload(powerup)
+            self.save_board()
+
+    def finger_pos(self, event):
+        """تحويل إحداثيات اللمس (من 0 لـ 1) لبكسلات الشاشة"""
+        return int(event.x * SCREEN_WIDTH), int(event.y * SCREEN_HEIGHT)
+
+    def on_press(self, pos, finger=None):
+        """ضغطة ماوس أو لمسة صباع (finger = finger_id): الأول فهرس الشاشة، وبعدين التصويب"""
+        if self.state in ["GAME_OVER", "LEVEL_UP"]:
+            self.set_state("MENU")
+            SaveSystem.save(game_data)
+            return
+        if self.state == "VERSUS" and self.versus.finished:
+            self.set_state("MENU")
+            return
+
+        ui = self.ui.get(self.state)
+        if ui and ui.dispatch(pos): return
+
+        if self.state in AIM_STATES:
+            if finger is None:
+                self.aim_pos = pos
+                self.shoot_at(pos)
+            elif self.aim_finger is None:
+                self.aim_finger = finger # اسحب للتصويب وسيب للضرب
+                self.aim_pos = pos
+
+    def on_motion(self, pos, finger=None):
+        if finger is None:
+            if self.state in AIM_STATES: self.aim_pos = pos
+            if self.state in self.ui: self.ui[self.state].update_hover(pos)
+        elif finger == self.aim_finger and self.state in AIM_STATES:
+            self.aim_pos = pos
+
+    def on_release(self, pos, finger):
+        if finger != self.aim_finger: return
+        self.aim_finger = None
+        self.aim_pos = pos
+        if self.state in AIM_STATES:
+            self.shoot_at(pos)
+
+    def handle_event(self, event):
+        if event.type == pygame.QUIT:
+            self.quit()
+
+        # الأندرويد ممكن يقفل اللعبة وهي في الخلفية، فنحفظ اللوحة قبلها
+        elif event.type == pygame.APP_WILLENTERBACKGROUND:
+            self.save_board()
+
+        # أحداث الماوس اللي SDL بيولدها من اللمس بنتجاهلها (بنستخدم FINGER مباشرة)
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and not getattr(event, "touch", False):
+            self.on_press(event.pos)
+        elif event.type == pygame.MOUSEMOTION and not getattr(event, "touch", False):
+            self.on_motion(event.pos)
+
+        elif event.type == pygame.FINGERDOWN:
+            self.on_press(self.finger_pos(event), event.finger_id)
+        elif event.type == pygame.FINGERMOTION:
+            self.on_motion(self.finger_pos(event), event.finger_id)
+        elif event.type == pygame.FINGERUP:
+            self.on_release(self.finger_pos(event), event.finger_id)
+
+    def reset_game(self):
+        self.gm = GridManager(game_data["level"])
+        self.shooter = Shooter(self.gm)
+        self.score = 0
+        self.combo = 1
+        self.history.clear()
+        self.particles.clear()
+        self.texts.clear()
+
+    def spawn_particles(self, x, y, color, count=10):
+        for _ in range(count):
+            self.particles.append(Particle(x, y, color))
+
+    def add_floating_text(self, x, y, text_ar, text_en, color):
+        self.texts.append(FloatingText(x, y, text_ar, text_en, color))
+
+    def award_coins(self, amount):
+        game_data["coins"] += amount
+
+    def draw_versus(self, surface):
+        """رسم لوحة اللاعب المحلي بس، ومعاها حالة الخصم وصفوف العقاب الجاية"""
+        vs = self.versus
+        if vs.player:
+            vs.player.gm.draw(surface)
+            vs.player.shooter.draw(surface, self.aim_pos)
+
+        pygame.draw.rect(surface, PANEL_COLOR, (0, 0, SCREEN_WIDTH, 60))
+        if vs.player:
+            ui_score = render_text(f"أنت: {vs.player.score}", f"YOU: {vs.player.score}", font_med, TEXT_COLOR)
+            ui_opp = render_text(f"الخصم: {vs.opponent.score}", f"RIVAL: {vs.opponent.score}", font_med, COLORS["orange"])
+            surface.blit(ui_score, (20, 10))
+            surface.blit(ui_opp, (SCREEN_WIDTH//2 - ui_opp.get_width()//2, 10))
+            if vs.player.incoming:
+                warn = render_text(f"عقاب جاي: {vs.player.incoming}", f"INCOMING: {vs.player.incoming}", font_small, COLORS["red"])
+                surface.blit(warn, (SCREEN_WIDTH//2 - warn.get_width()//2, 70))
+        self.ui["VERSUS"].draw(surface)
+
+        if vs.error:
+            title = render_text_cached("الاتصال وقع!", "CONNECTION LOST!", font_large, COLORS["red"])
+            msg = render_text(vs.error, vs.error, font_small, TEXT_COLOR)
+        elif vs.match is None:
+            title = render_text_cached("بنستنى الخصم...", "WAITING...", font_large, GOLD)
+            msg = render_text_cached("المباراة هتبدأ أول ما يدخل", "MATCH STARTS WHEN YOUR RIVAL JOINS", font_small, TEXT_COLOR)
+        elif vs.finished:
+            winner = vs.match.winner
+            if winner == vs.index:
+                title = render_text_cached("كسبت!", "YOU WIN!", font_large, COLORS["green"])
+            elif winner is None or winner == -1:
+                title = render_text_cached("تعادل!", "DRAW!", font_large, GOLD)
+            else:
+                title = render_text_cached("خسرت!", "YOU LOSE!", font_large, COLORS["red"])
+            msg = render_text_cached("اضغط للعودة", "CLICK TO RETURN", font_small, TEXT_COLOR)
+        else:
+            return
+        surface.blit(title, (SCREEN_WIDTH//2 - title.get_width()//2, 300))
+        surface.blit(msg, (SCREEN_WIDTH//2 - msg.get_width()//2, 450))
 
     def run(self):
         while self.running:
             screen.fill(BG_COLOR)
-            mouse_pos = pygame.mouse.get_pos()
             
             # 1. الاهتزاز (Screen Shake)
             offset_x, offset_y = 0, 0
@@ -523,159 +1070,74 @@ class Engine:
             for _ in range(5):
                 pygame.draw.circle(screen, (255,255,255), (random.randint(0, SCREEN_WIDTH), random.randint(0, SCREEN_HEIGHT)), 1)
 
-            # --- التحكم في الحالات (State Machine) ---
+            # --- التحكم في الحالات (Event-Driven Input) ---
             for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    SaveSystem.save(game_data)
-                    self.running = False
-                
-                if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                    
-                    if self.state == "MENU":
-                        if self.btn_play.check_hover(mouse_pos): self.state = "PLAYING"; self.reset_game()
-                        if self.btn_store.check_hover(mouse_pos): self.state = "STORE"
-                        if self.btn_settings.check_hover(mouse_pos): self.state = "SETTINGS"
-                        if self.btn_quit.check_hover(mouse_pos): self.running = False
-
-                    elif self.state == "STORE":
-                        if self.btn_back.check_hover(mouse_pos): self.state = "MENU"; SaveSystem.save(game_data)
-                        if self.btn_buy_bomb.check_hover(mouse_pos) and game_data["coins"] >= 100:
-                            game_data["coins"] -= 100; game_data["bombs"] += 1
-                        if self.btn_buy_fire.check_hover(mouse_pos) and game_data["coins"] >= 150:
-                            game_data["coins"] -= 150; game_data["fireballs"] += 1
-                        if self.btn_buy_rain.check_hover(mouse_pos) and game_data["coins"] >= 200:
-                            game_data["coins"] -= 200; game_data["rainbows"] += 1
-
-                    elif self.state == "SETTINGS":
-                        if self.btn_back.check_hover(mouse_pos): self.state = "MENU"
-                        if self.btn_sound.check_hover(mouse_pos): sound_mgr.toggle()
-
-                    elif self.state == "PLAYING":
-                        # فحص زراير الأدوات
-                        if self.btn_use_bomb.check_hover(mouse_pos) and game_data["bombs"] > 0:
-                            game_data["bombs"] -= 1; self.shooter.reload("bomb")
-                        elif self.btn_use_fire.check_hover(mouse_pos) and game_data["fireballs"] > 0:
-                            game_data["fireballs"] -= 1; self.shooter.reload("fireball")
-                        elif self.btn_use_rain.check_hover(mouse_pos) and game_data["rainbows"] > 0:
-                            game_data["rainbows"] -= 1; self.shooter.reload("rainbow")
-                        elif mouse_pos[1] > self.shooter.y - 40 and mouse_pos[1] < self.shooter.y + 40 and mouse_pos[0] > self.shooter.x - 120 and mouse_pos[0] < self.shooter.x + 40:
-                            self.shooter.swap() # تبديل الفقاعة إذا ضغط على منطقة المدفع
-                        else:
-                            self.shooter.shoot(mouse_pos[0], mouse_pos[1])
-
-                    elif self.state in ["GAME_OVER", "LEVEL_UP"]:
-                        self.state = "MENU"
-                        SaveSystem.save(game_data)
+                self.handle_event(event)
 
             # --- منطق ورسم كل حالة ---
             surface_game = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
 
             if self.state == "MENU":
-                title = render_text("لعبة عمر فقاعات برو", "BUBBLE SHOOTER PRO", font_large, GOLD)
+                title = render_text_cached("لعبة عمر فقاعات برو", "BUBBLE SHOOTER PRO", font_large, GOLD)
                 screen.blit(title, (SCREEN_WIDTH//2 - title.get_width()//2, 100))
-                self.btn_play.draw(screen)
-                self.btn_store.draw(screen)
-                self.btn_settings.draw(screen)
-                self.btn_quit.draw(screen)
+                self.ui["MENU"].draw(screen)
 
             elif self.state == "STORE":
-                title = render_text("المتجر - طور أسلحتك", "STORE", font_large, GOLD)
+                title = render_text_cached("المتجر - طور أسلحتك", "STORE", font_large, GOLD)
                 screen.blit(title, (SCREEN_WIDTH//2 - title.get_width()//2, 80))
                 coins_txt = render_text(f"عملاتك: {game_data['coins']}", f"COINS: {game_data['coins']}", font_med, COLORS["yellow"])
                 screen.blit(coins_txt, (SCREEN_WIDTH//2 - coins_txt.get_width()//2, 180))
-                
-                self.btn_buy_bomb.draw(screen)
+
+                self.ui["STORE"].draw(screen)
                 inv_bomb = render_text(f"معاك: {game_data['bombs']}", f"Owned: {game_data['bombs']}", font_small, TEXT_COLOR)
                 screen.blit(inv_bomb, (SCREEN_WIDTH//2 - inv_bomb.get_width()//2, 340))
                 
-                self.btn_buy_fire.draw(screen)
                 inv_fire = render_text(f"معاك: {game_data['fireballs']}", f"Owned: {game_data['fireballs']}", font_small, TEXT_COLOR)
                 screen.blit(inv_fire, (SCREEN_WIDTH//2 - inv_fire.get_width()//2, 440))
                 
-                self.btn_buy_rain.draw(screen)
                 inv_rain = render_text(f"معاك: {game_data['rainbows']}", f"Owned: {game_data['rainbows']}", font_small, TEXT_COLOR)
                 screen.blit(inv_rain, (SCREEN_WIDTH//2 - inv_rain.get_width()//2, 540))
-                
-                self.btn_back.draw(screen)
 
             elif self.state == "SETTINGS":
-                title = render_text("الإعدادات", "SETTINGS", font_large, GOLD)
+                title = render_text_cached("الإعدادات", "SETTINGS", font_large, GOLD)
                 screen.blit(title, (SCREEN_WIDTH//2 - title.get_width()//2, 100))
                 status = "شغال (ON)" if game_data["sound"] else "مقفول (OFF)"
-                self.btn_sound.text_ar = f"الصوت: {status}"
-                self.btn_sound.text_en = f"SOUND: {status}"
-                self.btn_sound.draw(screen)
-                self.btn_back.draw(screen)
+                self.btn_sound.set_text(f"الصوت: {status}", f"SOUND: {status}")
+                self.ui["SETTINGS"].draw(screen)
 
             elif self.state == "PLAYING":
-                # حركة الفقاعة (Collision Logic)
-                f = self.shooter.flying
-                if f:
-                    f.move()
-                    collided = False
-                    if f.y - f.radius <= self.gm.top_margin: collided = True
-                    else:
-                        for r in range(ROWS):
-                            for c in range(COLS):
-                                t = self.gm.grid[r][c]
-                                if t and math.hypot(f.x - t.x, f.y - t.y) <= RADIUS * 2 - 4:
-                                    collided = True; break
-                            if collided: break
-                    
-                    if collided:
-                        # التثبيت (Snapping)
-                        r, c = self.gm.get_row_col(f.x, f.y)
-                        if self.gm.grid[r][c]: # لو المكان مليان
-                            for nr, nc in self.get_neighbors(r, c):
-                                if not self.gm.grid[nr][nc]:
-                                    r, c = nr, nc; break
-                        
-                        if r < ROWS:
-                            f.x, f.y = self.gm.get_xy(r, c)
-                            f.is_moving = False
-                            self.gm.grid[r][c] = f
+                # حركة الفقاعة والتثبيت
+                if self.step_flying():
+                    # فحص الخسارة (Game Over Check)
+                    for col in range(COLS):
+                        if self.gm.grid[ROWS-2][col]:
+                            self.set_state("GAME_OVER")
+                            sound_mgr.play("lose")
+                            break
                             
-                            if self.process_match(r, c):
-                                self.remove_floating()
-
-                            # آلية سقوط السقف لزيادة الصعوبة
-                            if self.shooter.shots_fired % 10 == 0:
-                                self.gm.top_margin += ROW_HEIGHT
-                                self.screen_shake = 5
-                                self.add_floating_text(SCREEN_WIDTH//2, 150, "السقف يقترب!", "CEILING DROP!", COLORS["red"])
-
-                        self.shooter.flying = None
-
-                        # فحص الخسارة (Game Over Check)
-                        for col in range(COLS):
-                            if self.gm.grid[ROWS-2][col]:
-                                self.state = "GAME_OVER"
-                                sound_mgr.play("lose")
-                                break
-                                
-                        # فحص الفوز (Level Up Check)
-                        is_empty = all(self.gm.grid[r][c] is None for r in range(ROWS) for c in range(COLS))
-                        if is_empty:
-                            game_data["level"] += 1
-                            self.state = "LEVEL_UP"
-                            sound_mgr.play("win")
+                    # فحص الفوز (Level Up Check)
+                    is_empty = all(self.gm.grid[r][c] is None for r in range(ROWS) for c in range(COLS))
+                    if is_empty:
+                        game_data["level"] += 1
+                        self.set_state("LEVEL_UP")
+                        sound_mgr.play("win")
+
+                    # حفظ اللوحة بعد كل ضربة، ومسحها لما المستوى يخلص
+                    if self.state == "PLAYING": self.save_board()
+                    else:
+                        SaveSystem.save(game_data)
+                        SaveSystem.clear_board()
 
                 # رسم اللعبة
                 self.gm.draw(surface_game)
-                self.shooter.draw(surface_game, mouse_pos)
+                self.shooter.draw(surface_game, self.aim_pos)
                 
                 # رسم الأدوات السفلية
-                self.btn_use_bomb.text_ar = f"قنبلة({game_data['bombs']})"
-                self.btn_use_bomb.text_en = f"B({game_data['bombs']})"
-                self.btn_use_bomb.draw(surface_game)
-                
-                self.btn_use_fire.text_ar = f"نار({game_data['fireballs']})"
-                self.btn_use_fire.text_en = f"F({game_data['fireballs']})"
-                self.btn_use_fire.draw(surface_game)
-                
-                self.btn_use_rain.text_ar = f"قوس({game_data['rainbows']})"
-                self.btn_use_rain.text_en = f"R({game_data['rainbows']})"
-                self.btn_use_rain.draw(surface_game)
+                # النصوص بتتعمل لها render بس لما العدد يتغير
+                self.btn_use_bomb.set_text(f"قنبلة({game_data['bombs']})", f"B({game_data['bombs']})")
+                self.btn_use_fire.set_text(f"نار({game_data['fireballs']})", f"F({game_data['fireballs']})")
+                self.btn_use_rain.set_text(f"قوس({game_data['rainbows']})", f"R({game_data['rainbows']})")
+                self.ui["PLAYING"].draw(surface_game)
 
                 # UI اللعب العلوي (HUD)
                 pygame.draw.rect(surface_game, PANEL_COLOR, (0, 0, SCREEN_WIDTH, 60))
@@ -687,16 +1149,25 @@ class Engine:
                 surface_game.blit(ui_coins, (SCREEN_WIDTH//2 - ui_coins.get_width()//2, 10))
                 surface_game.blit(ui_lvl, (SCREEN_WIDTH - ui_lvl.get_width() - 20, 10))
 
+            elif self.state == "VERSUS_LOBBY":
+                title = render_text_cached("تحدي صاحبك", "VERSUS", font_large, GOLD)
+                screen.blit(title, (SCREEN_WIDTH//2 - title.get_width()//2, 100))
+                self.ui["VERSUS_LOBBY"].draw(screen)
+
+            elif self.state == "VERSUS":
+                self.versus.update()
+                self.draw_versus(surface_game)
+
             elif self.state == "GAME_OVER":
-                title = render_text("خسرت يا بطل!", "GAME OVER!", font_large, COLORS["red"])
+                title = render_text_cached("خسرت يا بطل!", "GAME OVER!", font_large, COLORS["red"])
                 screen.blit(title, (SCREEN_WIDTH//2 - title.get_width()//2, 300))
-                msg = render_text("اضغط في أي مكان للعودة", "CLICK TO RETURN", font_small, TEXT_COLOR)
+                msg = render_text_cached("اضغط في أي مكان للعودة", "CLICK TO RETURN", font_small, TEXT_COLOR)
                 screen.blit(msg, (SCREEN_WIDTH//2 - msg.get_width()//2, 450))
 
             elif self.state == "LEVEL_UP":
-                title = render_text("مستوى جديد!", "LEVEL UP!", font_large, COLORS["green"])
+                title = render_text_cached("مستوى جديد!", "LEVEL UP!", font_large, COLORS["green"])
                 screen.blit(title, (SCREEN_WIDTH//2 - title.get_width()//2, 300))
-                msg = render_text("عاش! اضغط للاستمرار", "NICE! CLICK TO CONTINUE", font_small, TEXT_COLOR)
+                msg = render_text_cached("عاش! اضغط للاستمرار", "NICE! CLICK TO CONTINUE", font_small, TEXT_COLOR)
                 screen.blit(msg, (SCREEN_WIDTH//2 - msg.get_width()//2, 450))
 
             # تحديث الجزيئات والنصوص (VFX Update)
@@ -718,6 +1189,308 @@ class Engine:
 
         pygame.quit()
 
+# ==========================================
+# 5. وضع الـ Versus (Lockstep Multiplayer)
+# ==========================================
+
+# الضربة بتتبعت كرقم واحد (2 بايت): مفيش / تبديل / زاوية بعُشر الدرجة
+NO_INPUT = 0
+SWAP_INPUT = 1
+ANGLE_BASE = 2
+
+class DesyncError(Exception):
+    """اللاعبين خرجوا عن التزامن (tick أو checksum مختلف)"""
+
+def encode_shot(degrees):
+    """زاوية الضربة لفوق (0 يمين، 180 شمال) -> كود الإدخال"""
+    return ANGLE_BASE + int(round(degrees * 10))
+
+class VersusPlayer(BoardRules):
+    """لوحة ومدفع لاعب واحد في الـ Versus، من غير رسم ولا عملات"""
+    def __init__(self, seed, level=VERSUS_LEVEL):
+        self.gm = GridManager(level, rng=random.Random(seed))
+        self.shooter = Shooter(self.gm)
+        self.score = 0
+        self.combo = 1
+        self.screen_shake = 0
+        self.outgoing = 0 # صفوف عقاب رايحة للخصم
+        self.incoming = 0 # صفوف عقاب جاية من الخصم
+        self.lost = False
+
+    def on_cleared(self, popped, dropped):
+        self.outgoing += popped // GARBAGE_GROUP + dropped // GARBAGE_DROP
+
+    def apply_input(self, code):
+        if code == SWAP_INPUT:
+            self.shooter.swap()
+        elif code != NO_INPUT:
+            angle = -math.radians((code - ANGLE_BASE) / 10)
+            self.shooter.shoot(self.shooter.x + math.cos(angle) * 100, self.shooter.y + math.sin(angle) * 100)
+
+    def step(self):
+        # العقاب بيتطبق بس والفقاعة مش طايرة، وفي أزواج عشان إزاحة الصفوف الفردية
+        if self.shooter.flying is None and self.incoming >= 2:
+            rows = self.incoming - self.incoming % 2
+            self.incoming -= rows
+            if self.gm.push_rows(rows): self.lost = True
+
+        self.step_flying()
+        if any(self.gm.grid[ROWS-2][col] for col in range(COLS)):
+            self.lost = True
+
+    def is_cleared(self):
+        return all(self.gm.grid[r][c] is None for r in range(ROWS) for c in range(COLS))
+
+class VersusMatch:
+    """المحاكاة المتزامنة: نفس الـ seed ونفس الإدخالات = نفس النتيجة عند الطرفين"""
+    def __init__(self, seed):
+        self.seed = seed
+        self.players = [VersusPlayer(seed), VersusPlayer(seed)]
+        self.tick = 0
+
+    def advance(self, inputs):
+        for player, code in zip(self.players, inputs):
+            player.apply_input(code)
+        for player in self.players:
+            player.step()
+
+        # تبادل صفوف العقاب
+        p0, p1 = self.players
+        p0.incoming += p1.outgoing
+        p1.incoming += p0.outgoing
+        p0.outgoing = p1.outgoing = 0
+        self.tick += 1
+
+    @property
+    def winner(self):
+        """رقم اللاعب الفايز، -1 للتعادل، None لو المباراة لسه شغالة"""
+        lost = [p.lost or self.players[1 - i].is_cleared() for i, p in enumerate(self.players)]
+        if all(lost): return -1
+        if lost[0]: return 1
+        if lost[1]: return 0
+        return None
+
+    def checksum(self):
+        """بصمة 16 بت لحالة اللوحتين (صفر معناه مفيش فحص في الـ tick ده)"""
+        data = b"".join(BoardCodec.encode(p.gm, p.shooter, p.score, p.combo) + bytes([p.incoming & 0xFF])
+                        for p in self.players)
+        return (zlib.crc32(data) & 0xFFFF) or 1
+
+class LockstepPeer:
+    """الاتصال بالخصم: كل tick بنبعت 6 بايت (tick، الضربة، checksum) ونستنى بتوعه"""
+    PACKET = struct.Struct("<HHH")
+    HANDSHAKE = struct.Struct("<II") # الـ seed وعدد الـ ticks من الهوست
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def send(self, tick, code, checksum):
+        self.writer.write(self.PACKET.pack(tick & 0xFFFF, code, checksum))
+
+    async def recv(self, tick, checksum):
+        peer_tick, peer_code, peer_checksum = self.PACKET.unpack(await self.reader.readexactly(self.PACKET.size))
+        if peer_tick != tick & 0xFFFF:
+            raise DesyncError(f"tick {tick}: peer is at tick {peer_tick}")
+        if checksum and peer_checksum != checksum:
+            raise DesyncError(f"tick {tick}: checksum {checksum:#06x} != peer {peer_checksum:#06x}")
+        return peer_code
+
+    async def exchange(self, tick, code, checksum):
+        self.send(tick, code, checksum)
+        await self.writer.drain()
+        return await self.recv(tick, checksum)
+
+    def close(self):
+        self.writer.close()
+
+    @staticmethod
+    async def host(port, seed, max_ticks, on_listen=None):
+        """on_listen بياخد رقم البورت الفعلي (مفيد مع port=0 في الاختبارات)"""
+        connected = asyncio.get_running_loop().create_future()
+
+        def on_connect(reader, writer):
+            # خصم واحد بس؛ أي اتصال زيادة بيتقفل بدل ما يفضل مستني الـ handshake
+            if connected.done():
+                writer.close()
+            else:
+                connected.set_result((reader, writer))
+
+        server = await asyncio.start_server(on_connect, VERSUS_HOST, port)
+        if on_listen: on_listen(server.sockets[0].getsockname()[1])
+        try:
+            reader, writer = await connected
+        finally:
+            server.close()
+        writer.write(LockstepPeer.HANDSHAKE.pack(seed, max_ticks))
+        await writer.drain()
+        return LockstepPeer(reader, writer)
+
+    @staticmethod
+    async def join(host, port, retries=50):
+        """بيحاول يتصل كذا مرة عشان لو الهوست لسه بيفتح، وبيرجع (peer, seed, max_ticks)"""
+        for attempt in range(retries):
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+                break
+            except OSError:
+                if attempt == retries - 1: raise
+                await asyncio.sleep(0.1)
+        seed, max_ticks = LockstepPeer.HANDSHAKE.unpack(await reader.readexactly(LockstepPeer.HANDSHAKE.size))
+        return LockstepPeer(reader, writer), seed, max_ticks
+
+# أي حاجة من دول معناها إن المباراة وقفت (خصم فصل، مفيش هوست، أو Desync)
+NETWORK_ERRORS = (DesyncError, OSError, asyncio.IncompleteReadError)
+
+def make_bot(seed):
+    """لاعب آلي بسيط للاختبار: بيضرب بزاوية عشوائية كل شوية"""
+    rng = random.Random(seed)
+    def bot(player):
+        if player.shooter.flying is not None or rng.random() > 0.05: return NO_INPUT
+        return encode_shot(rng.uniform(15, 165))
+    return bot
+
+async def play_versus(peer, index, seed, bot, max_ticks):
+    match = VersusMatch(seed)
+    while match.winner is None and match.tick < max_ticks:
+        code = bot(match.players[index])
+        checksum = match.checksum() if match.tick % CHECKSUM_INTERVAL == 0 else 0
+        peer_code = await peer.exchange(match.tick, code, checksum)
+        match.advance([code, peer_code] if index == 0 else [peer_code, code])
+    return match
+
+async def run_versus(role, host, port, seed, bot_seed, max_ticks, on_listen=None):
+    """كلاينت بوت كامل (Headless): الـ seed و max_ticks بتوع الجوين بييجوا من الهوست"""
+    if role == "host":
+        peer = await LockstepPeer.host(port, seed, max_ticks, on_listen)
+        index = 0
+    else:
+        peer, seed, max_ticks = await LockstepPeer.join(host, port)
+        index = 1
+    try:
+        return await play_versus(peer, index, seed, make_bot(bot_seed), max_ticks)
+    finally:
+        peer.close()
+
+class VersusSession:
+    """مباراة Versus جوه اللعبة نفسها: الـ Engine بينده update مرة كل فريم
+
+    بنشغل event loop خاص بالشبكة وبنلفه كل فريم لحد ما ضربة الخصم توصل، فالمحاكاة
+    بتمشي tick واحد في الفريم طول ما الطرفين متزامنين.
+    """
+    def __init__(self, role, host=VERSUS_HOST, port=VERSUS_PORT):
+        self.loop = asyncio.new_event_loop()
+        self.index = 0 if role == "host" else 1
+        self.match = None
+        self.peer = None
+        self.pending = None     # (tick، الضربة اللي اتبعتت، task استقبال ضربة الخصم)
+        self.queued = NO_INPUT  # ضربة اللاعب للـ tick الجاي
+        self.max_ticks = VERSUS_MAX_TICKS
+        self.error = None
+        if role == "host":
+            self.seed = random.randrange(2**32)
+            self.connecting = self.loop.create_task(LockstepPeer.host(port, self.seed, self.max_ticks))
+        else:
+            self.seed = None
+            self.connecting = self.loop.create_task(LockstepPeer.join(host, port))
+
+    @property
+    def player(self):
+        return self.match.players[self.index] if self.match else None
+
+    @property
+    def opponent(self):
+        return self.match.players[1 - self.index] if self.match else None
+
+    @property
+    def finished(self):
+        if self.error: return True
+        return self.match is not None and (self.match.winner is not None or self.match.tick >= self.max_ticks)
+
+    def queue_input(self, code):
+        if self.player and self.queued == NO_INPUT and (code == SWAP_INPUT or self.player.shooter.flying is None):
+            self.queued = code
+
+    def pump(self, task, timeout):
+        """تشغيل الـ loop لحد ما الـ task تخلص أو الوقت يخلص"""
+        self.loop.run_until_complete(asyncio.wait({task}, timeout=timeout))
+
+    def update(self):
+        if self.finished: return
+        try:
+            if self.match is None:
+                self.pump(self.connecting, 0)
+                if not self.connecting.done(): return
+                if self.index == 0:
+                    self.peer = self.connecting.result()
+                else:
+                    self.peer, self.seed, self.max_ticks = self.connecting.result()
+                self.match = VersusMatch(self.seed)
+
+            if self.pending is None:
+                tick = self.match.tick
+                checksum = self.match.checksum() if tick % CHECKSUM_INTERVAL == 0 else 0
+                code, self.queued = self.queued, NO_INPUT
+                self.peer.send(tick, code, checksum)
+                self.pending = (code, self.loop.create_task(self.peer.recv(tick, checksum)))
+
+            code, task = self.pending
+            self.pump(task, 1 / FPS)
+            if not task.done(): return
+            self.pending = None
+            peer_code = task.result()
+            self.match.advance([code, peer_code] if self.index == 0 else [peer_code, code])
+        except NETWORK_ERRORS as e:
+            self.error = str(e) or type(e).__name__
+
+    def close(self):
+        for task in [self.connecting] + ([self.pending[1]] if self.pending else []):
+            task.cancel()
+        if self.peer: self.peer.close()
+        try:
+            self.loop.run_until_complete(asyncio.sleep(0))
+        finally:
+            self.loop.close()
+
+def seed_arg(value):
+    seed = int(value)
+    if not 0 <= seed < 2**32:
+        raise argparse.ArgumentTypeError(f"seed must be in [0, 2**32): {value}")
+    return seed
+
+def ticks_arg(value):
+    ticks = int(value)
+    if not 0 < ticks < 2**32:
+        raise argparse.ArgumentTypeError(f"ticks must be in (0, 2**32): {value}")
+    return ticks
+
+def versus_main(argv):
+    parser = argparse.ArgumentParser(description="Bubble Shooter Pro - headless versus client")
+    parser.add_argument("--versus", choices=["host", "join"], required=True)
+    parser.add_argument("--host", default=VERSUS_HOST)
+    parser.add_argument("--port", type=int, default=VERSUS_PORT)
+    parser.add_argument("--seed", type=seed_arg, default=random.randrange(2**32))
+    parser.add_argument("--bot-seed", type=int, default=None)
+    parser.add_argument("--ticks", type=ticks_arg, default=10000, help="host only; sent to the joiner")
+    args = parser.parse_args(argv)
+
+    try:
+        match = asyncio.run(run_versus(args.versus, args.host, args.port, args.seed, args.bot_seed, args.ticks))
+    except DesyncError as e:
+        print(f"❌ خروج عن التزامن (Desync): {e}")
+        return 1
+    except asyncio.IncompleteReadError:
+        print("❌ الخصم قفل الاتصال (Peer disconnected)")
+        return 1
+    except OSError as e:
+        print(f"❌ مشكلة في الاتصال (Network error): {e}")
+        return 1
+    scores = [p.score for p in match.players]
+    print(f"🏁 seed={match.seed} ticks={match.tick} winner={match.winner} scores={scores} checksum={match.checksum():#06x}")
+    return 0
+
 if __name__ == "__main__":
+    if "--versus" in sys.argv:
+        sys.exit(versus_main(sys.argv[1:]))
     game = Engine()
     game.run()
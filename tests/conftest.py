@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import main  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_save(tmp_path, monkeypatch):
+    """Run every test in an empty directory with default save data."""
+    monkeypatch.chdir(tmp_path)
+    main.game_data.clear()
+    main.game_data.update({"level": 1, "coins": 0, "bombs": 1, "fireballs": 1, "rainbows": 1, "sound": True})
+
+
+@pytest.fixture
+def engine():
+    return main.Engine()
@@ -0,0 +1,139 @@
+import json
+import random
+
+import main
+
+
+def _bubbles(gm):
+    return [(r, c, b.color_name, b.is_powerup, b.x, b.y)
+            for r, row in enumerate(gm.grid) for c, b in enumerate(row) if b]
+
+
+def _land(engine):
+    while engine.shooter.flying:
+        engine.step_flying()
+
+
+def test_round_trip_keeps_powerups_and_positions():
+    gm = main.GridManager(5, rng=random.Random(7))
+    gm.lower_ceiling()
+    gm.lower_ceiling()
+    gm.grid[0][0].is_powerup = "bomb"
+    gm.grid[1][2].is_powerup = "rainbow"
+    shooter = main.Shooter(gm)
+    shooter.reload("fireball")
+    shooter.shots_fired = 17
+
+    data = main.BoardCodec.encode(gm, shooter, 1234, 3)
+    assert len(data) == main.BoardCodec.SIZE
+
+    snap = main.BoardCodec.decode(data)
+    assert snap["top_margin"] == 80 + 2 * main.ROW_HEIGHT
+    assert (snap["level"], snap["shots_fired"], snap["score"], snap["combo"]) == (5, 17, 1234, 3)
+    assert snap["current"] == (shooter.current.color_name, "fireball")
+
+    restored = main.GridManager(snap["level"], snap["cells"], top_margin=snap["top_margin"])
+    assert _bubbles(restored) == _bubbles(gm)
+
+    restored_shooter = main.Shooter(restored)
+    restored_shooter.restore(snap["current"], snap["next"], snap["shots_fired"])
+    assert main.BoardCodec.encode(restored, restored_shooter, 1234, 3) == data
+
+
+def test_decode_rejects_corrupt_data():
+    gm = main.GridManager(1, rng=random.Random(1))
+    data = bytearray(main.BoardCodec.encode(gm, main.Shooter(gm), 0, 1))
+    for bad in (0x0F, 0x51, 0x10):
+        data[main.BoardCodec.HEADER.size] = bad
+        assert main.BoardCodec.decode(bytes(data)) is None
+    assert main.BoardCodec.decode(bytes(data[:-1])) is None
+
+
+def test_engine_restore_after_ceiling_drop_keeps_positions(engine):
+    engine.start_game()
+    engine.gm.lower_ceiling()
+    before = _bubbles(engine.gm)
+    assert engine.restore_snapshot(engine.snapshot())
+    assert _bubbles(engine.gm) == before
+
+
+def test_undo_refunds_coins_and_powerups(engine):
+    engine.start_game()
+    main.game_data.update({"coins": 50, "bombs": 1})
+    before = engine.snapshot()
+
+    engine.fire((270, 300))
+    _land(engine)
+    main.game_data["coins"] = 999
+    engine.use_powerup("bombs", "bomb")
+    assert main.game_data["bombs"] == 0
+
+    engine.undo()
+    assert engine.snapshot() == before
+    assert main.game_data["coins"] == 50
+    assert main.game_data["bombs"] == 1
+    assert engine.shooter.current.is_powerup is None
+    assert not engine.history
+
+
+def test_undo_is_ignored_while_flying(engine):
+    engine.start_game()
+    engine.fire((270, 300))
+    flying = engine.shooter.flying
+    assert flying is not None
+
+    engine.undo()
+    assert engine.shooter.flying is flying
+    assert len(engine.history) == 1
+
+
+def test_undo_saves_board_and_inventory(engine):
+    engine.start_game()
+    before = engine.snapshot()
+    engine.fire((270, 300))
+    _land(engine)
+    engine.use_powerup("bombs", "bomb")
+
+    engine.undo()
+    assert main.SaveSystem.load_board() == before
+    with open(main.SaveSystem.FILE_NAME) as f:
+        assert json.load(f)["bombs"] == 1
+
+
+def test_start_game_resumes_saved_board(engine):
+    engine.start_game()
+    engine.fire((270, 300))
+    _land(engine)
+    engine.save_board()
+    saved = engine.snapshot()
+
+    resumed = main.Engine()
+    resumed.start_game()
+    assert resumed.snapshot() == saved
+    assert resumed.shooter.shots_fired == 1
+
+
+def test_start_game_rejects_board_from_other_level(engine):
+    engine.start_game()
+    engine.fire((270, 300))
+    _land(engine)
+    engine.save_board()
+
+    main.game_data["level"] = 2
+    fresh = main.Engine()
+    fresh.start_game()
+    assert fresh.state == "PLAYING"
+    assert fresh.gm.level == 2
+    assert fresh.shooter.shots_fired == 0
+
+
+def test_start_game_rejects_corrupt_board(engine):
+    engine.start_game()
+    data = bytearray(engine.snapshot())
+    data[main.BoardCodec.HEADER.size] = 0x0F
+    main.SaveSystem.save_board(bytes(data))
+
+    engine.set_state("MENU")
+    engine.start_game()
+    assert engine.state == "PLAYING"
+    assert engine.shooter.shots_fired == 0
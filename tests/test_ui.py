@@ -0,0 +1,89 @@
+import pygame
+
+import main
+
+
+def finger(engine, kind, finger_id, x, y):
+    engine.handle_event(pygame.event.Event(kind, x=x / main.SCREEN_WIDTH, y=y / main.SCREEN_HEIGHT,
+                                           finger_id=finger_id, touch_id=0, dx=0, dy=0))
+
+
+def test_hit_test_returns_first_target():
+    calls = []
+    ui = main.UIScreen()
+    button = ui.add_button(main.Button(100, 100, 80, 40, "", "A", main.TEXT_COLOR), lambda: calls.append("button"))
+    ui.add_zone((0, 0, 200, 200), lambda: calls.append("zone"))
+
+    assert ui.hit_test((100, 100))[0] is button
+    assert ui.hit_test((10, 10))[0] is None
+    assert ui.hit_test((300, 300)) == (None, None)
+
+    assert ui.dispatch((100, 100))
+    assert ui.dispatch((10, 10))
+    assert not ui.dispatch((300, 300))
+    assert calls == ["button", "zone"]
+
+
+def test_toolbar_button_wins_over_swap_zone(engine):
+    engine.start_game()
+    pos = (engine.btn_use_fire.rect.centerx, engine.btn_use_fire.rect.top + 2)
+    assert engine.ui["PLAYING"].hit_test(pos)[0] is engine.btn_use_fire
+
+    current, next_bubble = engine.shooter.current, engine.shooter.next
+    engine.on_press(pos)
+    assert main.game_data["fireballs"] == 0
+    assert engine.shooter.current.is_powerup == "fireball"
+    assert engine.shooter.next is not current # a swap would have moved current into next
+
+
+def test_hover_follows_mouse_motion(engine):
+    engine.on_motion(engine.btn_play.rect.center)
+    assert engine.btn_play.hovered
+    engine.on_motion((0, 0))
+    assert not engine.btn_play.hovered
+
+
+def test_second_finger_neither_aims_nor_fires(engine):
+    engine.start_game()
+    finger(engine, pygame.FINGERDOWN, 0, 270, 300)
+    finger(engine, pygame.FINGERDOWN, 1, 400, 500)
+    assert engine.aim_pos == (270, 300)
+
+    finger(engine, pygame.FINGERMOTION, 1, 50, 50)
+    assert engine.aim_pos == (270, 300)
+
+    finger(engine, pygame.FINGERUP, 1, 50, 50)
+    assert engine.shooter.flying is None
+    assert engine.aim_finger == 0
+
+
+def test_releasing_aiming_finger_fires(engine):
+    engine.start_game()
+    finger(engine, pygame.FINGERDOWN, 3, 270, 300)
+    finger(engine, pygame.FINGERMOTION, 3, 200, 300)
+    assert engine.aim_pos == (200, 300)
+    assert engine.shooter.flying is None
+
+    finger(engine, pygame.FINGERUP, 3, 200, 300)
+    assert engine.shooter.flying is not None
+    assert engine.shooter.flying.dx < 0
+    assert engine.aim_finger is None
+
+
+def test_toolbar_tap_while_aiming_does_not_fire(engine):
+    engine.start_game()
+    finger(engine, pygame.FINGERDOWN, 0, 270, 300)
+    bomb = engine.btn_use_bomb.rect.center
+    finger(engine, pygame.FINGERDOWN, 1, *bomb)
+    finger(engine, pygame.FINGERUP, 1, *bomb)
+    assert engine.shooter.current.is_powerup == "bomb"
+    assert engine.shooter.flying is None
+
+
+def test_game_over_clears_aim_and_hover(engine):
+    engine.start_game()
+    finger(engine, pygame.FINGERDOWN, 0, 270, 300)
+    engine.on_motion(engine.btn_use_bomb.rect.center)
+    engine.set_state("GAME_OVER")
+    assert engine.aim_finger is None
+    assert not engine.btn_use_bomb.hovered
@@ -0,0 +1,128 @@
+import asyncio
+
+import main
+
+
+async def _play_both(seed, max_ticks, joiner_ticks):
+    port = asyncio.get_running_loop().create_future()
+    host = asyncio.ensure_future(
+        main.run_versus("host", main.VERSUS_HOST, 0, seed, 1, max_ticks, on_listen=port.set_result))
+    join = main.run_versus("join", main.VERSUS_HOST, await port, None, 2, joiner_ticks)
+    return await asyncio.gather(host, join)
+
+
+def _spy_push_rows(monkeypatch):
+    calls = []
+    push_rows = main.GridManager.push_rows
+
+    def spy(self, count):
+        calls.append(count)
+        return push_rows(self, count)
+
+    monkeypatch.setattr(main.GridManager, "push_rows", spy)
+    return calls
+
+
+def test_two_headless_clients_stay_in_lockstep(monkeypatch):
+    pushes = _spy_push_rows(monkeypatch)
+    # seed 25 with bot seeds 1/2 trades garbage and ends with a winner well before the limit;
+    # the joiner asks for a different tick limit and the host's value wins via the handshake
+    host, join = asyncio.run(_play_both(seed=25, max_ticks=3000, joiner_ticks=10))
+
+    assert host.seed == join.seed == 25
+    assert host.tick == join.tick < 3000
+    assert host.winner == join.winner
+    assert host.winner in (0, 1)
+    assert pushes
+    assert host.checksum() == join.checksum()
+    assert [p.score for p in host.players] == [p.score for p in join.players]
+
+
+def _clear(player):
+    player.gm.grid = [[None for _ in range(main.COLS)] for _ in range(main.ROWS)]
+
+
+def _place(player, row, col, color):
+    x, y = player.gm.get_xy(row, col)
+    player.gm.grid[row][col] = main.Bubble(x, y, color)
+
+
+def test_big_clear_and_drop_send_garbage_to_opponent():
+    match = main.VersusMatch(seed=3)
+    attacker, defender = match.players
+
+    # ten reds on the ceiling with ten blues hanging off them; the last red completes the row
+    _clear(attacker)
+    for col in range(main.COLS - 1):
+        _place(attacker, 0, col, "red")
+        _place(attacker, 1, col, "blue")
+    x, y = attacker.gm.get_xy(0, main.COLS - 1)
+    shot = main.Bubble(x, y, "red")
+    shot.dx, shot.dy, shot.is_moving = 0, -1, True
+    attacker.shooter.flying = shot
+    attacker.shooter.shots_fired = 1 # no ceiling drop on this landing
+
+    before = [row[:] for row in defender.gm.grid]
+    match.advance([main.NO_INPUT, main.NO_INPUT])
+
+    # 11 popped -> 11 // GARBAGE_GROUP, 10 dropped -> 10 // GARBAGE_DROP
+    expected = 11 // main.GARBAGE_GROUP + 10 // main.GARBAGE_DROP
+    assert attacker.is_cleared()
+    assert defender.incoming == expected
+    assert attacker.outgoing == 0
+
+    match.advance([main.NO_INPUT, main.NO_INPUT])
+    pushed = expected - expected % 2
+    assert defender.incoming == expected % 2
+    assert all(defender.gm.grid[r][c] for r in range(pushed) for c in range(main.COLS)
+               if not (r % 2 and c == main.COLS - 1))
+    assert defender.gm.grid[pushed:] == before[:main.ROWS - pushed]
+    assert match.winner == 0 # attacker cleared their board
+
+
+def test_push_rows_overflow_loses_and_keeps_grid_size():
+    player = main.VersusPlayer(seed=1)
+    assert player.gm.push_rows(16)
+    assert len(player.gm.grid) == main.ROWS
+
+    player = main.VersusPlayer(seed=1)
+    player.incoming = 40
+    player.step()
+    assert player.lost
+    assert len(player.gm.grid) == main.ROWS
+
+
+def test_process_match_on_empty_cell_returns_zero():
+    player = main.VersusPlayer(seed=1)
+    _clear(player)
+    assert player.process_match(5, 5) == 0
+
+
+def test_host_closes_extra_connections():
+    async def scenario():
+        port = asyncio.get_running_loop().create_future()
+        host = asyncio.ensure_future(main.LockstepPeer.host(0, 7, 100, on_listen=port.set_result))
+        port = await port
+        first, second = await asyncio.gather(asyncio.open_connection(main.VERSUS_HOST, port),
+                                             asyncio.open_connection(main.VERSUS_HOST, port))
+        peer = await host
+        size = main.LockstepPeer.HANDSHAKE.size
+        replies = await asyncio.wait_for(asyncio.gather(first[0].read(size), second[0].read(size)), 2)
+        peer.close()
+        for _, writer in (first, second):
+            writer.close()
+        return sorted(replies, key=len)
+
+    extra, handshake = asyncio.run(scenario())
+    assert main.LockstepPeer.HANDSHAKE.unpack(handshake) == (7, 100)
+    assert extra == b""
+
+
+def test_versus_menu_entry_hidden_off_desktop(monkeypatch):
+    engine = main.Engine()
+    assert engine.ui["MENU"].hit_test(engine.btn_versus.rect.center)[0] is engine.btn_versus
+
+    monkeypatch.setattr(main, "VERSUS_IN_MENU", False)
+    engine = main.Engine()
+    assert engine.btn_versus not in engine.ui["MENU"].buttons
+    assert engine.btn_quit.rect.centery == 700